@@ -12,6 +12,8 @@ Environment variables:
 
 import os
 import smtplib
+import threading
+import time
 from email.message import EmailMessage
 
 ENABLE = os.environ.get("NOTIFY_EMAIL", "false").lower() == "true"
@@ -21,6 +23,36 @@ SENDER = os.environ.get("EMAIL_SENDER")
 PASSWORD = os.environ.get("EMAIL_PASSWORD")
 RECIPIENT = os.environ.get("EMAIL_RECIPIENT")
 
+# Logged-in SMTP session reused across alerts for up to SMTP_KEEPALIVE seconds
+SMTP_KEEPALIVE = 90
+_smtp = None
+_smtp_expires = 0.0
+_LOCK = threading.Lock()
+
+def _close_smtp():
+    global _smtp
+    if _smtp is not None:
+        try:
+            _smtp.quit()
+        except Exception:
+            pass
+    _smtp = None
+
+def _get_smtp():
+    global _smtp, _smtp_expires
+    if _smtp is None or time.monotonic() > _smtp_expires:
+        _close_smtp()
+        smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
+        try:
+            smtp.starttls()
+            smtp.login(SENDER, PASSWORD)
+        except Exception:
+            smtp.close()  # don't leak the socket when TLS or auth fails
+            raise
+        _smtp = smtp
+        _smtp_expires = time.monotonic() + SMTP_KEEPALIVE
+    return _smtp
+
 def send_email_alert(subject: str, body: str):
     """Send email alert if enabled and config present."""
     if not ENABLE:
@@ -36,10 +68,13 @@ def send_email_alert(subject: str, body: str):
         msg["Subject"] = subject
         msg.set_content(body)
 
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as smtp:
-            smtp.starttls()
-            smtp.login(SENDER, PASSWORD)
-            smtp.send_message(msg)
+        with _LOCK:
+            try:
+                _get_smtp().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # server dropped the idle session; reconnect once and retry
+                _close_smtp()
+                _get_smtp().send_message(msg)
 
         return True
     except Exception as e:
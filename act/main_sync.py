@@ -6,12 +6,22 @@ TallyPrime → SQL Server Sync
 - Auto table creation & UPSERT by NAME
 """
 
+import io
+import asyncio
+import httpx
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
 import pyodbc
-import pandas as pd
 import re
 import logging
+import itertools
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
 from datetime import datetime
 
@@ -23,6 +33,9 @@ SQL_SERVERS_TO_TRY = [r"LOHITH\\SQLEXPRESS", "127.0.0.1,1433"]
 ODBC_DRIVER = "{ODBC Driver 17 for SQL Server}"
 DEFAULT_DB = "lohit"
 UPSERT_BATCH_SIZE = 200
+TALLY_CONCURRENCY = 4
+UPSERT_WORKERS = 4
+SCHEMA_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_cache.json")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,13 +44,18 @@ logging.basicConfig(
 )
 
 # ---------------- SQL UTILS ----------------
+# Larger TDS packets (set pre-connect as SQL_ATTR_PACKET_SIZE; it is not a
+# connection-string keyword for the MS ODBC driver) cut frames on bulk inserts.
+SQL_ATTR_PACKET_SIZE = 112
+_CONN_ATTRS = {SQL_ATTR_PACKET_SIZE: 32768}
+
+def _dsn(server, db):
+    return f"DRIVER={ODBC_DRIVER};SERVER={server};DATABASE={db};Trusted_Connection=yes;MARS_Connection=yes;"
+
 def connect_sql_interactive():
     for server in SQL_SERVERS_TO_TRY:
         try:
-            conn = pyodbc.connect(
-                f"DRIVER={ODBC_DRIVER};SERVER={server};DATABASE=master;Trusted_Connection=yes;",
-                timeout=5
-            )
+            conn = pyodbc.connect(_dsn(server, "master"), timeout=5, attrs_before=_CONN_ATTRS)
             logging.info(f"Connected to SQL Server: {server}")
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sys.databases")
@@ -57,98 +75,230 @@ def connect_sql_interactive():
                 logging.info(f"Created new database: {db_name}")
 
             conn.close()
-            conn = pyodbc.connect(
-                f"DRIVER={ODBC_DRIVER};SERVER={server};DATABASE={db_name};Trusted_Connection=yes;",
-                timeout=5
-            )
+            conn = pyodbc.connect(_dsn(server, db_name), timeout=5, attrs_before=_CONN_ATTRS)
             logging.info(f"Connected to database {db_name} on server {server}")
             return conn
         except Exception as e:
             logging.warning(f"Failed SQL connection to {server}: {e}")
     raise Exception("All SQL Server connection attempts failed.")
 
-def connect_sql_default():
+def connect_sql_default(db_name=DEFAULT_DB):
     for server in SQL_SERVERS_TO_TRY:
         try:
-            conn = pyodbc.connect(
-                f"DRIVER={ODBC_DRIVER};SERVER={server};DATABASE={DEFAULT_DB};Trusted_Connection=yes;",
-                timeout=5
-            )
-            logging.info(f"Connected to default DB {DEFAULT_DB} on server {server}")
+            conn = pyodbc.connect(_dsn(server, db_name), timeout=5, attrs_before=_CONN_ATTRS)
+            logging.info(f"Connected to DB {db_name} on server {server}")
             return conn
         except Exception as e:
             logging.warning(f"Failed SQL connection to {server}: {e}")
     raise Exception("All SQL Server connection attempts failed.")
 
-def upsert_dataframe(df: pd.DataFrame, table: str, conn):
-    if df.empty:
-        logging.warning(f"Empty DataFrame for {table}, skipping.")
-        return
+# Long-lived connections keyed by (thread id, database name), reused across runs.
+# pyodbc connections must not be shared between threads (a session's #stg and
+# open transaction belong to whichever thread is using it), so each thread gets its own.
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+def get_conn(db_name=None):
+    key = (threading.get_ident(), db_name or DEFAULT_DB)
+    with _POOL_LOCK:
+        conn = _POOL.get(key)
+    if conn is None or conn.closed:
+        # only this thread ever uses `key`, so connecting outside the lock can't race
+        conn = connect_sql_default(key[1])
+        with _POOL_LOCK:
+            _POOL[key] = conn
+    return conn
+
+def _discard_conn(conn):
+    # drop a broken connection from the pool, so the next get_conn reconnects
+    with _POOL_LOCK:
+        for key in [k for k, cached in _POOL.items() if cached is conn]:
+            del _POOL[key]
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+# Column sets of tables already created/verified, keyed by (database, table).
+# Persisted to SCHEMA_CACHE_FILE so restarts and scheduler ticks skip the DDL probes.
+_SCHEMA_LOCK = threading.Lock()
+# CREATE/ALTER run one at a time and commit straight away, so parallel upsert
+# sessions never hold schema locks for the length of their staging + MERGE
+_DDL_LOCK = threading.Lock()
+
+def _load_schema_cache():
+    try:
+        with open(SCHEMA_CACHE_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+        return {(db, table): set(cols) for db, tables in data.items() for table, cols in tables.items()}
+    except Exception:
+        return {}
+
+def _save_schema_cache():
+    data = {}
+    for (db, table), cols in _TABLE_COLS.items():
+        data.setdefault(db, {})[table] = sorted(cols)
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(SCHEMA_CACHE_FILE)), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, SCHEMA_CACHE_FILE)
+    except Exception as e:
+        logging.warning(f"Could not write {SCHEMA_CACHE_FILE}: {e}")
+
+def _remember_schema(key, cols):
+    with _SCHEMA_LOCK:
+        if _TABLE_COLS.get(key) != cols:
+            _TABLE_COLS[key] = cols
+            _save_schema_cache()
+
+def _forget_schema(key):
+    with _SCHEMA_LOCK:
+        if _TABLE_COLS.pop(key, None) is not None:
+            _save_schema_cache()
+
+_TABLE_COLS = _load_schema_cache()
+
+def _upsert_rows(conn, rows, columns, table, known_cols):
+    """Stage `rows` and MERGE them by NAME; returns the table's column set.
+
+    `known_cols` is the cached column set, or None to create/alter the table first.
+    """
     cursor = conn.cursor()
     safe_table = f"[{table}]"
+    existing_cols = known_cols
+    if existing_cols is None:
+        with _DDL_LOCK:
+            # Create table if not exists
+            col_defs = ", ".join([f"[{col}] NVARCHAR(MAX)" for col in columns])
+            cursor.execute(f"IF OBJECT_ID(N'{table}', 'U') IS NULL CREATE TABLE {safe_table} ({col_defs})")
 
-    # Create table if not exists
-    columns = ", ".join([f"[{col}] NVARCHAR(MAX)" for col in df.columns])
-    cursor.execute(f"IF OBJECT_ID(N'{table}', 'U') IS NULL CREATE TABLE {safe_table} ({columns})")
-    conn.commit()
+            # --- NEW: Ensure schema has all columns ---
+            cursor.execute(f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?", table)
+            existing_cols = {r[0] for r in cursor.fetchall()}
+            missing_cols = [c for c in columns if c not in existing_cols]
+            for col in missing_cols:
+                cursor.execute(f"ALTER TABLE {safe_table} ADD [{col}] NVARCHAR(MAX)")
+                logging.info(f"Altering {table}: added new column [{col}]")
+                existing_cols.add(col)
+            # --- END NEW ---
+            conn.commit()
 
-    # --- NEW: Ensure schema has all columns ---
-    cursor.execute(f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?", table)
-    existing_cols = {r[0] for r in cursor.fetchall()}
-    missing_cols = [c for c in df.columns if c not in existing_cols]
-    for col in missing_cols:
-        cursor.execute(f"ALTER TABLE {safe_table} ADD [{col}] NVARCHAR(MAX)")
-        logging.info(f"Altering {table}: added new column [{col}]")
-    conn.commit()
-    # --- END NEW ---
-
-    # Upsert rows
-    for _, row in df.iterrows():
-        assignments = ", ".join([f"[{col}] = ?" for col in df.columns])
-        placeholders = ", ".join(["?"] * len(df.columns))
-        sql = f"""
-        MERGE {safe_table} AS target
-        USING (SELECT ? AS [NAME]) AS source
-        ON target.[NAME] = source.[NAME]
-        WHEN MATCHED THEN UPDATE SET {assignments}
-        WHEN NOT MATCHED THEN INSERT ({", ".join(f"[{c}]" for c in df.columns)})
-        VALUES ({placeholders});
-        """
-        values = [row["NAME"]] + row.tolist() + row.tolist()
-        cursor.execute(sql, values)
+    # Upsert rows: bulk-load into a session temp table, then MERGE once
+    cols = ", ".join(f"[{c}]" for c in columns)
+    row_qmarks = "(" + ", ".join(["?"] * len(columns)) + ")"
+    assignments = ", ".join(f"t.[{c}] = s.[{c}]" for c in columns)
+    source_cols = ", ".join(f"s.[{c}]" for c in columns)
+    # SQL Server caps a statement at 2100 parameters
+    chunk_size = max(1, min(UPSERT_BATCH_SIZE, 2000 // len(columns)))
+
+    cursor.execute("IF OBJECT_ID('tempdb..#stg') IS NOT NULL DROP TABLE #stg")
+    cursor.execute(f"SELECT TOP 0 {cols} INTO #stg FROM {safe_table}")
+    # every full chunk reuses the same statement text (and pyodbc's prepared handle)
+    insert_sql = f"INSERT INTO #stg ({cols}) VALUES "
+    full_chunk_sql = insert_sql + ", ".join([row_qmarks] * chunk_size)
+    row_iter = iter(rows)
+    while chunk := list(itertools.islice(row_iter, chunk_size)):
+        if len(chunk) == chunk_size:
+            sql = full_chunk_sql
+        else:
+            sql = insert_sql + ", ".join([row_qmarks] * len(chunk))
+        cursor.execute(sql, list(itertools.chain.from_iterable(chunk)))
+    cursor.execute(f"""
+    MERGE {safe_table} AS t
+    USING #stg AS s
+    ON t.[NAME] = s.[NAME]
+    WHEN MATCHED THEN UPDATE SET {assignments}
+    WHEN NOT MATCHED THEN INSERT ({cols})
+    VALUES ({source_cols});
+    """)
+    cursor.execute("DROP TABLE #stg")
     conn.commit()
-    logging.info(f"Upserted {len(df)} rows into {table}")
+    return existing_cols
+
+def upsert_dataframe(rows: list, columns: list, table: str, conn):
+    if not rows:
+        logging.warning(f"No rows for {table}, skipping.")
+        return
+    schema_key = (conn.getinfo(pyodbc.SQL_DATABASE_NAME), table)
+    name_idx = columns.index("NAME")
+    rows = list({row[name_idx]: row for row in rows}.values())  # last duplicate NAME wins
+
+    # pyodbc runs with autocommit off: the schema step commits on its own, then
+    # staging and MERGE share one implicit transaction, rolled back on failure
+    known_cols = _TABLE_COLS.get(schema_key)
+    if known_cols is not None and not known_cols.issuperset(columns):
+        known_cols = None
+    while True:
+        try:
+            existing_cols = _upsert_rows(conn, rows, columns, table, known_cols)
+            break
+        except Exception as e:
+            alive = True
+            try:
+                conn.rollback()
+            except pyodbc.Error as rb_err:
+                # the link itself is gone; evict it so the next get_conn reconnects
+                logging.warning(f"Rollback on {table} failed, dropping connection: {rb_err}")
+                _discard_conn(conn)
+                alive = False
+            # the cached schema may be what's stale (e.g. table dropped or altered
+            # outside this tool); re-probe, once, in this same call
+            _forget_schema(schema_key)
+            if known_cols is None or not alive or not isinstance(e, pyodbc.Error):
+                raise
+            logging.warning(f"Upsert into {table} failed with cached schema, re-probing: {e}")
+            known_cols = None
+    _remember_schema(schema_key, existing_cols)
+    logging.info(f"Upserted {len(rows)} rows into {table}")
 
 
 # ---------------- TALLY UTILS ----------------
-def send_request(xml: str) -> str:
+# control chars are dropped and bare ampersands escaped, in one pass
+_CLEAN_XML = re.compile(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]|&(?!(?:amp;|lt;|gt;|apos;|quot;))")
+
+def _clean_xml_repl(m):
+    return "&amp;" if m.group(0) == "&" else ""
+
+# One keep-alive session for all Tally calls instead of a new socket per request
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                                      max_retries=Retry(total=2, backoff_factor=0.1)))
+
+def send_request(body: bytes):
     try:
-        resp = requests.post(TALLY_URL, data=xml.encode("utf-8"), headers=HEADERS)
+        resp = _SESSION.post(TALLY_URL, data=body, timeout=30)
         return resp.text
     except Exception as e:
         logging.error(f"Tally request failed: {e}")
-        return ""
+        return None
 
-def parse_xml_to_df(xml: str, tags: list) -> pd.DataFrame:
+def parse_xml_to_df(xml: str, tags: list):
     try:
-        xml = re.sub(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]", "", xml)
-        xml = re.sub(r"&(?!(amp;|lt;|gt;|apos;|quot;))", "&amp;", xml)
-        root = ET.fromstring(xml)
+        xml = _CLEAN_XML.sub(_clean_xml_repl, xml)
         rows = []
-        for obj in root.iter("COLLECTION"):
-            for child in obj:
-                row = {}
-                for tag in tags:
-                    el = child.find(tag)
-                    row[tag] = el.text if el is not None else None
-                rows.append(row)
-        return pd.DataFrame(rows)
+        tag_pos = {tag: i for i, tag in enumerate(tags)}
+        for _, coll in etree.iterparse(io.BytesIO(xml.encode("utf-8")), events=("end",), tag="COLLECTION",
+                                       recover=True, remove_comments=True):
+            for child in coll:
+                # one walk over the child's elements instead of a find() per tag
+                row = [None] * len(tags)
+                for el in child:
+                    i = tag_pos.get(el.tag)
+                    if i is not None and row[i] is None:
+                        row[i] = el.text
+                rows.append(tuple(row))
+            # free each parsed collection (and already-seen siblings) as we go
+            coll.clear()
+            while coll.getprevious() is not None:
+                del coll.getparent()[0]
+        return list(tags), rows
     except Exception as e:
         logging.error(f"Parse error: {e}")
-        return pd.DataFrame(columns=tags)
+        return list(tags), []
 
-def fetch_master(master: str, full_fields: list):
-    xml_full = f"""
+_FULL_REQUEST_XML = """
     <ENVELOPE>
       <HEADER>
         <VERSION>1</VERSION>
@@ -165,13 +315,8 @@ def fetch_master(master: str, full_fields: list):
       </BODY>
     </ENVELOPE>
     """
-    resp = send_request(xml_full)
-    df = parse_xml_to_df(resp, full_fields)
-    if not df.empty:
-        logging.info(f"{master}: Licensed mode (full fields)")
-        return df
 
-    xml_edu = f"""
+_EDU_REQUEST_XML = """
     <ENVELOPE>
       <HEADER>
         <VERSION>1</VERSION>
@@ -192,10 +337,110 @@ def fetch_master(master: str, full_fields: list):
       </BODY>
     </ENVELOPE>
     """
-    resp = send_request(xml_edu)
-    df = parse_xml_to_df(resp, ["NAME"])
+
+def _build_request_bodies(master: str):
+    return (_FULL_REQUEST_XML.format(master=master).encode("utf-8"),
+            _EDU_REQUEST_XML.format(master=master).encode("utf-8"))
+
+def _request_bodies(master: str):
+    return _BODIES.get(master) or _build_request_bodies(master)
+
+# Shared by the sync and async fetch paths: parse each response and decide on the fallback
+def _full_result(master: str, full_fields: list, resp):
+    """(columns, rows) from the full-fields response, or None to fall back to Edu mode."""
+    # Tally unreachable: don't spend a second request on the Edu fallback
+    if resp is None:
+        return list(full_fields), []
+    columns, rows = parse_xml_to_df(resp, full_fields)
+    if rows:
+        logging.info(f"{master}: Licensed mode (full fields)")
+        return columns, rows
+    return None
+
+def _edu_result(master: str, resp):
+    if resp is None:
+        return ["NAME"], []
+    columns, rows = parse_xml_to_df(resp, ["NAME"])
     logging.info(f"{master}: Edu mode (NAME only)")
-    return df
+    return columns, rows
+
+def fetch_master(master: str, full_fields: list):
+    full_body, edu_body = _request_bodies(master)
+    result = _full_result(master, full_fields, send_request(full_body))
+    if result is None:
+        result = _edu_result(master, send_request(edu_body))
+    return result
+
+# ---------------- ASYNC FETCH ----------------
+async def _send_request_async(client, body: bytes):
+    try:
+        resp = await client.post(TALLY_URL, content=body)
+        return resp.text
+    except Exception as e:
+        logging.error(f"Tally request failed: {e}")
+        return None
+
+async def _fetch_async(client, sem, master: str, full_fields: list):
+    loop = asyncio.get_running_loop()
+    full_body, edu_body = _request_bodies(master)
+    # the semaphore only bounds requests in flight; parsing runs off the event
+    # loop so large responses don't stall the other fetches
+    async with sem:
+        resp = await _send_request_async(client, full_body)
+    result = await loop.run_in_executor(None, _full_result, master, full_fields, resp)
+    if result is None:
+        async with sem:
+            resp = await _send_request_async(client, edu_body)
+        result = await loop.run_in_executor(None, _edu_result, master, resp)
+    return result
+
+# Dedicated upsert workers, each holding its own SQL connection for the length of
+# a run (pyodbc connections must not be shared between threads)
+_UPSERT_POOL = ThreadPoolExecutor(max_workers=UPSERT_WORKERS, thread_name_prefix="upsert")
+
+def _upsert_on_thread_conn(rows, columns, table, db_name, conns):
+    # `conns` maps worker thread id -> that worker's connection for the current run
+    ident = threading.get_ident()
+    conn = conns.get(ident)
+    if conn is None:
+        conn = conns[ident] = connect_sql_default(db_name or DEFAULT_DB)
+    try:
+        upsert_dataframe(rows, columns, table, conn)
+    except Exception:
+        # don't hand a possibly broken session to this worker's next master
+        del conns[ident]
+        _discard_conn(conn)
+        raise
+
+# Tally fetches overlap (up to TALLY_CONCURRENCY in flight); each fetched master
+# is handed to the upsert pool, so SQL writes for different masters overlap too.
+# A failing master is logged and doesn't cut the others short; returns the failed names.
+async def _sync_masters_async(masters: dict, db_name=None):
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(TALLY_CONCURRENCY)
+    conns = {}
+
+    async def sync_one(client, master, fields):
+        logging.info(f"Fetching {master}...")
+        columns, rows = await _fetch_async(client, sem, master, fields)
+        logging.info(f"{master}: Parsed {len(rows)} rows")
+        await loop.run_in_executor(_UPSERT_POOL, _upsert_on_thread_conn, rows, columns, master, db_name, conns)
+
+    limits = httpx.Limits(max_connections=TALLY_CONCURRENCY)
+    try:
+        async with httpx.AsyncClient(headers=HEADERS, timeout=30, limits=limits) as client:
+            results = await asyncio.gather(*(sync_one(client, m, f) for m, f in masters.items()),
+                                           return_exceptions=True)
+    finally:
+        # every upsert has finished by now (gather waits for all of them)
+        for conn in conns.values():
+            _discard_conn(conn)
+    failed = []
+    for master, result in zip(masters, results):
+        if isinstance(result, Exception):
+            logging.error(f"{master}: sync failed: {result}")
+            failed.append(master)
+    return failed
 
 # ---------------- MASTERS ----------------
 MASTERS = {
@@ -225,6 +470,9 @@ MASTERS = {
     "StatutoryFeature": ["NAME"]
 }
 
+# Encoded (full, edu) request bodies for every known master, built once at import
+_BODIES = {master: _build_request_bodies(master) for master in MASTERS}
+
 # ---------------- RUN MODES ----------------
 def run_interactive():
     conn = connect_sql_interactive()
@@ -241,22 +489,19 @@ def run_interactive():
     for master in selected:
         fields = MASTERS[master]
         logging.info(f"Fetching {master}...")
-        df = fetch_master(master, fields)
-        logging.info(f"{master}: Parsed {len(df)} rows")
-        upsert_dataframe(df, master, conn)
+        columns, rows = fetch_master(master, fields)
+        logging.info(f"{master}: Parsed {len(rows)} rows")
+        upsert_dataframe(rows, columns, master, conn)
 
     conn.close()
     logging.info("Interactive sync complete.")
 
 def run_once_all():
-    conn = connect_sql_default()
-    for master, fields in MASTERS.items():
-        logging.info(f"Fetching {master}...")
-        df = fetch_master(master, fields)
-        logging.info(f"{master}: Parsed {len(df)} rows")
-        upsert_dataframe(df, master, conn)
-    conn.close()
-    logging.info("One-time sync (all masters) complete.")
+    failed = asyncio.run(_sync_masters_async(MASTERS, DEFAULT_DB))
+    if failed:
+        logging.error(f"One-time sync (all masters) finished; failed: {', '.join(failed)}")
+    else:
+        logging.info("One-time sync (all masters) complete.")
 
 def run_scheduler():
     scheduler = BlockingScheduler()
@@ -297,14 +542,13 @@ if __name__ == "__main__":
  
 
 def run_selected(selected_masters):
-    conn = connect_sql_default()
+    conn = get_conn(DEFAULT_DB)
     for master in selected_masters:
         fields = MASTERS.get(master, ["NAME"])
         logging.info(f"Fetching {master}...")
-        df = fetch_master(master, fields)
-        logging.info(f"{master}: Parsed {len(df)} rows")
-        upsert_dataframe(df, master, conn)
-    conn.close()
+        columns, rows = fetch_master(master, fields)
+        logging.info(f"{master}: Parsed {len(rows)} rows")
+        upsert_dataframe(rows, columns, master, conn)
     logging.info("Selected masters sync complete.")
 def run_interactive(db_name=None):
     print(f"Running interactive sync on database: {db_name}")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Persistent portal state (jobs + recent log lines) in a local SQLite file.
+
+- WAL journal, so readers never block the single writer
+- jobs: one row per job (JSON body) plus an `active` flag for restart
+- logs: ring-buffer table trimmed by a trigger to the newest `max_rows` lines
+
+Single process only: this is write-through persistence for one portal process, not
+coordination between several. There is no claim/lease on jobs, so two processes
+sharing the file would each restore and run every active job.
+"""
+
+import json
+import sqlite3
+import threading
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)  # autocommit
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL keeps this crash-safe; skips an fsync per commit
+    return conn
+
+
+class JobStore:
+    """Job dicts keyed by id. Safe to share between threads."""
+
+    def __init__(self, path):
+        self._conn = _connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, active INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def load(self):
+        """Return [(job, active)] in creation order."""
+        with self._lock:
+            rows = self._conn.execute("SELECT data, active FROM jobs ORDER BY rowid").fetchall()
+        return [(json.loads(data), bool(active)) for data, active in rows]
+
+    def save(self, job):
+        """Insert or overwrite a job, keeping its current `active` flag."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, data, active) "
+                "VALUES (?, ?, COALESCE((SELECT active FROM jobs WHERE id = ?), 0))",
+                (job["id"], json.dumps(job), job["id"]),
+            )
+
+    def set_active(self, job_id, active):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET active = ? WHERE id = ?", (int(active), job_id))
+
+    def delete(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+class LogStore:
+    """Append-only log of (ts, msg) lines, capped at `max_rows`."""
+
+    def __init__(self, path, max_rows=2000):
+        self._conn = _connect(path)
+        self._lock = threading.Lock()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, ts TEXT NOT NULL, msg TEXT NOT NULL)")
+        # recreate so a changed max_rows takes effect
+        self._conn.execute("DROP TRIGGER IF EXISTS logs_ring")
+        self._conn.execute(
+            f"CREATE TRIGGER logs_ring AFTER INSERT ON logs "
+            f"BEGIN DELETE FROM logs WHERE id <= NEW.id - {int(max_rows)}; END"
+        )
+
+    def append_many(self, lines):
+        """Append [(ts, msg)] in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO logs (ts, msg) VALUES (?, ?)", lines)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def tail(self, n):
+        """Return the newest `n` lines as [(ts, msg)], oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT ts, msg FROM logs ORDER BY id DESC LIMIT ?", (n,)).fetchall()
+        rows.reverse()
+        return rows
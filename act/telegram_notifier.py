@@ -10,10 +10,14 @@ Telegram alert utility for critical errors
 import os
 import requests
 
-BOT_TOKEN = os.environ.get("8238241182:AAHz6KXHTJk-tCw-YWFvm9--aRsHeDVtR6E")
-CHAT_ID = os.environ.get("5056158338")
+BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
 ENABLE = os.environ.get("NOTIFY_TELEGRAM", "false").lower() == "true"
 
+# Resolved once; alerts reuse one keep-alive session
+_TG_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage" if BOT_TOKEN else None
+_SESSION = requests.Session()
+
 def send_telegram_alert(message: str):
     """Send Telegram alert if enabled and configured."""
     if not ENABLE:
@@ -22,9 +26,8 @@ def send_telegram_alert(message: str):
         print("⚠ Telegram alert disabled — missing token/chat id.")
         return False
     try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
         payload = {"chat_id": CHAT_ID, "text": message}
-        resp = requests.post(url, data=payload, timeout=8)
+        resp = _SESSION.post(_TG_URL, data=payload, timeout=8)
         if resp.status_code != 200:
             print("⚠ Telegram response:", resp.status_code, resp.text)
             return False
@@ -65,15 +65,14 @@ class SyncApp(App):
 
     async def sync_selected(self):
         log = self.query_one("#log", Log)
-        conn = main_sync.connect_sql_default()
+        conn = main_sync.get_conn(main_sync.DEFAULT_DB)
         for master in self.selected_masters:
             log.write(f"🔄 Fetching {master} ...")
-            df = main_sync.fetch_master(master, main_sync.MASTERS[master])
-            log.write(f"{master}: Parsed {len(df)} rows")
-            main_sync.upsert_dataframe(df, master, conn)
+            columns, rows = main_sync.fetch_master(master, main_sync.MASTERS[master])
+            log.write(f"{master}: Parsed {len(rows)} rows")
+            main_sync.upsert_dataframe(rows, columns, master, conn)
             log.write(f"{master}: ✅ Synced successfully\n")
             await asyncio.sleep(0.1)
-        conn.close()
         log.write("✅ Interactive sync complete.")
 
     async def run_once(self):
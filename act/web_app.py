@@ -8,25 +8,39 @@ Flask web app for Tally → SQL Sync Portal
 Adds multi-job scheduler:
 - create / edit / delete jobs
 - start / stop jobs independently
-- jobs saved in-memory (jobs list)
+- jobs kept in memory (jobs list) and persisted to SQLite (state.py), resumed on restart
 
 Also adds Connections checks:
 - /connections page
 - /api/check_sql
 - /api/check_tally
+
+Run (production): gunicorn -k gthread -w 1 --threads 16 --chdir act -b 0.0.0.0:5000 web_app:app
+Run (development): FLASK_DEBUG=1 python web_app.py
 """
 
 from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
 import threading
+import asyncio
 import logging
 import pyodbc
 import main_sync  # backend sync implementation
+from state import JobStore, LogStore
 from datetime import datetime, timedelta
 import time
-from functools import wraps
+from functools import wraps, partial
+from contextlib import contextmanager
+from concurrent import futures
 import os
+import re
+import gzip
+import sys
+import atexit
+import queue
 import uuid
+from collections import deque
 import requests  # used for Tally HTTP probe
+from requests.adapters import HTTPAdapter
 
 # ---------------- FLASK APP CONFIG ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -37,25 +51,131 @@ app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
 app.secret_key = os.environ.get("SYNC_APP_SECRET") or "dev-secret-change-me"
 
 # ---------------- GLOBAL STATE ----------------
-log_text = []
+# Jobs and recent log lines survive restarts in this SQLite file (WAL mode)
+STATE_DB = os.environ.get("SYNC_STATE_DB") or os.path.join(BASE_DIR, "portal_state.db")
+LOG_LINES = 2000
+job_store = JobStore(STATE_DB)
+log_store = LogStore(STATE_DB, max_rows=LOG_LINES)
+
+log_text = deque((f"[{ts}] {msg}" for ts, msg in log_store.tail(LOG_LINES)), maxlen=LOG_LINES)  # oldest lines drop off automatically
+_log_lock = threading.Lock()
+_log_version = 0  # bumped by add_log; backs the /get_logs ETag
 selected_masters = []
 download_history = []
 # JOBS: list of dicts {id, name, db, type, interval, time, day, date, status}
 jobs = []
-# job threads state: job_id -> {"thread": Thread, "stop": Event}
+# id -> job dict (same objects as in `jobs`) for O(1) lookups; both guarded by _jobs_lock
+jobs_by_id = {}
+_jobs_lock = threading.Lock()
+_jobs_version = 0  # bumped by _touch_jobs whenever any job changes; backs the /jobs ETag
+# running jobs: job_id -> JobWorker; also guarded by _jobs_lock
 job_threads = {}
 
+# Shared, bounded pool for all blocking sync work (run modes, downloads, scheduled jobs)
+SYNC_POOL = futures.ThreadPoolExecutor(max_workers=int(os.environ.get("SYNC_WORKERS", 4)), thread_name_prefix="sync")
+atexit.register(SYNC_POOL.shutdown, wait=False, cancel_futures=True)
+
 # Tally probe URL (fallback); can be overridden by env var TALLY_URL
 TALLY_URL = os.environ.get("TALLY_URL", "http://localhost:9000")
+# Keep-alive session so repeated Tally probes reuse one TCP connection
+TALLY_SESSION = requests.Session()
+TALLY_SESSION.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=3))
 
 # ---------------- HELPERS ----------------
+# Console echo + SQLite persistence of log lines is batched by one writer thread
+# (up to 64 lines or 100 ms)
+_log_q = queue.Queue()
+
+def _write_log_batch(batch):
+    sys.stdout.write("".join(f"[{ts}] {msg}\n" for ts, msg in batch))
+    sys.stdout.flush()
+    try:
+        log_store.append_many(batch)
+    except Exception as e:
+        sys.stderr.write(f"log persistence failed: {e}\n")
+
+def _log_writer():
+    while True:
+        batch = [_log_q.get()]
+        deadline = time.monotonic() + 0.1
+        while len(batch) < 64:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_log_q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write_log_batch(batch)
+
+def _drain_logs():
+    batch = []
+    while True:
+        try:
+            batch.append(_log_q.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_log_batch(batch)
+
+threading.Thread(target=_log_writer, name="log-writer", daemon=True).start()
+atexit.register(_drain_logs)
+
 def add_log(msg):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    global _log_version
+    ts = time.strftime('%Y-%m-%d %H:%M:%S')
     full = f"[{ts}] {msg}"
-    print(full)
-    log_text.append(full)
-    if len(log_text) > 2000:
-        log_text.pop(0)
+    _log_q.put((ts, msg))
+    with _log_lock:
+        log_text.append(full)
+        _log_version += 1
+
+def _touch_jobs(job=None):
+    """Bump the jobs version; also persist `job` when one was changed."""
+    global _jobs_version
+    with _jobs_lock:
+        # a job deleted while its run was still finishing must not be written back;
+        # checked under the lock delete_job holds while removing it from the store
+        if job is not None and job["id"] in jobs_by_id:
+            job_store.save(job)
+        _jobs_version += 1
+
+# ---------------- HTTP CACHING / COMPRESSION ----------------
+# Versions restart with the process, so the ETag carries a per-boot token too
+_BOOT_ID = uuid.uuid4().hex[:8]
+GZIP_MIN_BYTES = 1024
+
+def _not_modified(etag):
+    """304 response if the client already holds `etag` (identity or gzip variant), else None."""
+    for held in (etag, f"{etag}-gz"):
+        if request.if_none_match.contains(held):
+            return "", 304, {"ETag": f'"{held}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    return None
+
+def _with_etag(resp, etag):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate, usually with a cheap 304
+    return resp
+
+@app.after_request
+def gzip_response(resp):
+    """Gzip larger text/JSON bodies for clients that accept it."""
+    if (resp.status_code != 200 or resp.direct_passthrough or "Content-Encoding" in resp.headers
+            or not (resp.mimetype.startswith("text/") or resp.mimetype in ("application/json", "application/javascript"))):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if "gzip" not in request.headers.get("Accept-Encoding", "").lower():
+        return resp
+    body = resp.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return resp
+    resp.set_data(gzip.compress(body, compresslevel=6))
+    resp.headers["Content-Encoding"] = "gzip"
+    # different bytes, so a different validator than the identity body
+    etag, weak = resp.get_etag()
+    if etag:
+        resp.set_etag(f"{etag}-gz", weak)
+    return resp
 
 def login_required(fn):
     @wraps(fn)
@@ -66,6 +186,52 @@ def login_required(fn):
         return redirect(url_for("login"))
     return wrapper
 
+# Health-check results shared by every open tab: key -> (monotonic ts, json payload, status).
+# Successes are reused longer than failures; ?refresh=1 forces a live check.
+HC_TTL_OK = 27
+HC_TTL_FAIL = 9
+_hc_cache = {}
+_hc_lock = threading.Lock()  # guards _hc_cache/_hc_inflight only, never held during a probe
+_hc_inflight = {}  # key -> threading.Event set when the running probe finishes
+
+def health_cached(key):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            refresh = request.args.get("refresh") == "1"
+            with _hc_lock:
+                hit = _hc_cache.get(key)
+                if hit and not refresh:
+                    ts, payload, status = hit
+                    ttl = HC_TTL_OK if payload.get("ok") else HC_TTL_FAIL
+                    if time.monotonic() - ts < ttl:
+                        return jsonify(payload), status
+                # single flight: only one caller probes; the rest don't queue behind it
+                done = _hc_inflight.get(key)
+                probing = done is None
+                if probing:
+                    done = _hc_inflight[key] = threading.Event()
+            if not probing:
+                if hit and not refresh:
+                    return jsonify(hit[1]), hit[2]  # stale until the running probe lands
+                done.wait()
+                hit = _hc_cache.get(key)
+                if hit:
+                    return jsonify(hit[1]), hit[2]
+                return fn(*args, **kwargs)  # that probe raised; try our own
+            try:
+                rv = fn(*args, **kwargs)
+                resp, status = rv if isinstance(rv, tuple) else (rv, 200)
+                with _hc_lock:
+                    _hc_cache[key] = (time.monotonic(), resp.get_json(), status)
+                return rv
+            finally:
+                with _hc_lock:
+                    del _hc_inflight[key]
+                done.set()
+        return wrapper
+    return decorator
+
 # ---------------- AUTH ROUTES ----------------
 @app.route("/", methods=["GET"])
 def login():
@@ -110,11 +276,7 @@ def runonce():
 def scheduler():
     """Render scheduler page — includes jobs list for client JS."""
     try:
-        conn = main_sync.connect_sql_default()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sys.databases WHERE database_id > 4")
-        databases = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        databases = list_databases()
     except Exception as e:
         add_log(f"⚠ Error fetching databases for scheduler: {e}")
         databases = []
@@ -150,20 +312,14 @@ def connections_page():
 
 @app.route("/api/check_sql")
 @login_required
+@health_cached("sql")
 def api_check_sql():
-    """Check MS SQL Server connectivity using main_sync.connect_sql_default()."""
+    """Check MS SQL Server connectivity with a pooled connection (see get_sql_conn)."""
     try:
-        conn = None
-        try:
-            conn = main_sync.connect_sql_default()
-        except Exception as e:
-            # If main_sync doesn't provide it or it fails, raise to be handled below
-            raise RuntimeError(f"main_sync.connect_sql_default() error: {e}")
-
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        row = cursor.fetchone()
-        conn.close()
+        with get_sql_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            row = cursor.fetchone()
         ok = (row is not None)
         msg = "SQL OK (SELECT 1 returned)" if ok else "SQL responded but unexpected result"
         add_log(f"🧪 SQL check: {msg}")
@@ -174,6 +330,7 @@ def api_check_sql():
 
 @app.route("/api/check_tally")
 @login_required
+@health_cached("tally")
 def api_check_tally():
     """
     Check Tally connection.
@@ -200,7 +357,7 @@ def api_check_tally():
 
         # Fallback: HTTP GET to TALLY_URL
         try:
-            resp = requests.get(TALLY_URL, timeout=4)
+            resp = TALLY_SESSION.get(TALLY_URL, timeout=4)
             if resp.status_code < 400:
                 msg = f"Tally HTTP OK ({resp.status_code}) at {TALLY_URL}"
                 add_log(f"🧪 Tally check: {msg}")
@@ -250,32 +407,83 @@ def run_mode(mode):
             add_log(f"⚠ Error during {mode}: {e}")
         finally:
             add_log(f"✅ Finished mode: {mode}")
-    threading.Thread(target=run_task, daemon=True).start()
+    SYNC_POOL.submit(run_task)
     return jsonify({"status": "started", "mode": mode, "database": db_name})
 
 @app.route("/get_logs")
 @login_required
 def get_logs():
-    return jsonify({"logs": log_text})
+    etag = f"logs-{_BOOT_ID}-{_log_version}"
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    with _log_lock:
+        logs = list(log_text)
+        etag = f"logs-{_BOOT_ID}-{_log_version}"
+    return _with_etag(jsonify({"logs": logs}), etag)
 
 # ---------------- DATABASE OPS ----------------
-def get_sql_connection():
-    return main_sync.connect_sql_default()
+# Idle SQL connections kept open between requests. A connection is checked out by
+# exactly one request at a time (pyodbc transactions are per connection).
+_SQL_POOL = queue.Queue(maxsize=int(os.environ.get("SQL_POOL_SIZE", 8)))
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+@contextmanager
+def get_sql_conn():
+    """Check out a pooled SQL connection, opening a new one if none are idle."""
+    try:
+        conn = _SQL_POOL.get_nowait()
+    except queue.Empty:
+        conn = main_sync.connect_sql_default()
+    try:
+        yield conn
+    except Exception:
+        _close_quietly(conn)
+        raise
+    try:
+        conn.rollback()  # never hand an open transaction to the next request
+        conn.cursor().execute("SELECT 1").fetchone()
+        _SQL_POOL.put_nowait(conn)
+    except Exception:
+        # broken connection, or the pool is already full
+        _close_quietly(conn)
+
+# user databases change rarely; share one sys.databases query across requests
+_dbs_cache = {"ts": 0.0, "value": []}
+_dbs_lock = threading.Lock()
+
+def list_databases(ttl=15.0):
+    """Return user database names, re-querying SQL Server at most once per `ttl` seconds."""
+    with _dbs_lock:
+        if time.monotonic() - _dbs_cache["ts"] >= ttl:
+            with get_sql_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sys.databases WHERE database_id > 4")
+                _dbs_cache["value"] = [row[0] for row in cursor.fetchall()]
+            _dbs_cache["ts"] = time.monotonic()
+        return list(_dbs_cache["value"])
+
+def _invalidate_databases():
+    with _dbs_lock:
+        _dbs_cache["ts"] = 0.0
 
 @app.route("/get_databases")
 @login_required
 def get_databases():
     try:
-        conn = get_sql_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sys.databases WHERE database_id > 4")
-        dbs = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return jsonify({"databases": dbs})
+        return jsonify({"databases": list_databases()})
     except Exception as e:
         add_log(f"⚠ Database fetch failed: {e}")
         return jsonify({"error": str(e)}), 500
 
+# CREATE DATABASE cannot take a parameter, so names are restricted to plain identifiers
+_DB_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{0,127}")
+
 @app.route("/create_database", methods=["POST"])
 @login_required
 def create_database():
@@ -283,12 +491,20 @@ def create_database():
     db_name = data.get("name")
     if not db_name:
         return jsonify({"error": "Database name required"}), 400
+    if not isinstance(db_name, str) or not _DB_NAME_RE.fullmatch(db_name):
+        return jsonify({"error": "Invalid database name (letters, digits and _ only)"}), 400
     try:
-        conn = get_sql_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"IF DB_ID('{db_name}') IS NULL CREATE DATABASE [{db_name}]")
-        conn.commit()
-        conn.close()
+        with get_sql_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DB_ID(?)", db_name)
+            if cursor.fetchone()[0] is None:
+                # CREATE DATABASE is not allowed inside a transaction
+                conn.autocommit = True
+                try:
+                    cursor.execute(f"CREATE DATABASE [{db_name}]")
+                finally:
+                    conn.autocommit = False
+                _invalidate_databases()
         add_log(f"✅ Database '{db_name}' created successfully.")
         return jsonify({"message": f"Database '{db_name}' created successfully."})
     except Exception as e:
@@ -321,94 +537,158 @@ def download_now():
             entry["status"] = "failed"
             entry["notes"] = (entry.get("notes", "") + f" | Error: {e}")
             add_log(f"⚠ Download failed: {e}")
-    threading.Thread(target=dl_task, daemon=True).start()
+    SYNC_POOL.submit(dl_task)
     return jsonify({"status": "started", "ts": ts})
 
 # ---------------- SCHEDULER: shared helpers ----------------
-def _next_run_time_now(s_type, interval=None, time_str=None, day=None, date_iso=None):
-    now = datetime.now()
-    if s_type == "interval":
-        return now + timedelta(minutes=max(1, int(interval or 15)))
-    if s_type == "daily":
-        hh, mm = map(int, (time_str or "02:00").split(":"))
-        next_dt = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
-        if next_dt <= now:
-            next_dt += timedelta(days=1)
-        return next_dt
-    if s_type == "monthly":
-        dd = int(day or 1)
-        hh, mm = map(int, (time_str or "02:00").split(":"))
-        year = now.year
-        month = now.month
+# Each job's schedule is parsed once (on create/update) into a next-run callable;
+# the scheduler then only calls job_schedules[job_id](now).
+job_schedules = {}
+
+def _parse_hhmm(time_str):
+    hh, mm = map(int, (time_str or "02:00").split(":"))
+    return hh, mm
+
+def _next_interval(minutes, now):
+    return now + timedelta(minutes=minutes)
+
+def _next_daily(hh, mm, now):
+    next_dt = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if next_dt <= now:
+        next_dt += timedelta(days=1)
+    return next_dt
+
+def _next_monthly(dd, hh, mm, now):
+    year = now.year
+    month = now.month
+    try:
+        candidate = datetime(year, month, dd, hh, mm)
+    except Exception:
+        candidate = (datetime(year, month, 1) + timedelta(days=31)).replace(day=1, hour=hh, minute=mm)
+    if candidate <= now:
+        month += 1
+        if month > 12:
+            month = 1
+            year += 1
         try:
             candidate = datetime(year, month, dd, hh, mm)
         except Exception:
             candidate = (datetime(year, month, 1) + timedelta(days=31)).replace(day=1, hour=hh, minute=mm)
-        if candidate <= now:
-            month += 1
-            if month > 12:
-                month = 1
-                year += 1
-            try:
-                candidate = datetime(year, month, dd, hh, mm)
-            except Exception:
-                candidate = (datetime(year, month, 1) + timedelta(days=31)).replace(day=1, hour=hh, minute=mm)
-        return candidate
+    return candidate
+
+def _next_yearly(mm, dd, hh, minu, now):
+    year = now.year
+    try:
+        candidate = datetime(year, mm, dd, hh, minu)
+    except Exception:
+        candidate = datetime(year, 1, 1, hh, minu)
+    if candidate <= now:
+        candidate = candidate.replace(year=year + 1)
+    return candidate
+
+def _compile_schedule(job):
+    """Return next_fn(now) -> datetime for a job dict; raises ValueError on bad fields."""
+    s_type = job.get("type")
+    if s_type == "interval":
+        return partial(_next_interval, max(1, int(job.get("interval") or 15)))
+    if s_type == "daily":
+        return partial(_next_daily, *_parse_hhmm(job.get("time")))
+    if s_type == "monthly":
+        return partial(_next_monthly, int(job.get("day") or 1), *_parse_hhmm(job.get("time")))
     if s_type == "yearly":
-        if not date_iso:
-            mmday = (1, 1)
-        else:
-            parts = date_iso.split("-")
-            mmday = (int(parts[1]), int(parts[2])) if len(parts) >= 3 else (1, 1)
-        mm, dd = mmday
-        hh, minu = map(int, (time_str or "02:00").split(":"))
-        year = now.year
-        try:
-            candidate = datetime(year, mm, dd, hh, minu)
-        except Exception:
-            candidate = datetime(year, 1, 1, hh, minu)
-        if candidate <= now:
-            candidate = candidate.replace(year=year + 1)
-        return candidate
-    return now + timedelta(minutes=15)
+        date_iso = job.get("date")
+        parts = date_iso.split("-") if date_iso else []
+        mmday = (int(parts[1]), int(parts[2])) if len(parts) >= 3 else (1, 1)
+        return partial(_next_yearly, *mmday, *_parse_hhmm(job.get("time")))
+    return partial(_next_interval, 15)
 
-def _job_loop(job):
+class SchedulerThread(threading.Thread):
+    """
+    Single background thread owning the asyncio loop that drives every job.
+    Jobs are coroutines on this loop, so N jobs cost no extra threads.
+    """
+    def __init__(self):
+        super().__init__(name="job-scheduler", daemon=True)
+        self._ready = threading.Event()
+        self._loop = None
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    @property
+    def loop(self):
+        self._ready.wait()
+        return self._loop
+
+scheduler_thread = SchedulerThread()
+scheduler_thread.start()
+
+class JobWorker:
     """
-    Background loop for a single job dict.
+    One job's coroutine on the scheduler loop.
+    The stop event is created (and only ever touched) on that loop; stop() is safe from any thread.
+    """
+    def __init__(self, job):
+        self._stop_event = None
+        self._stop_requested = False
+        self.future = asyncio.run_coroutine_threadsafe(self._run(job), scheduler_thread.loop)
+
+    async def _run(self, job):
+        self._stop_event = asyncio.Event()
+        if self._stop_requested:  # stopped before the coroutine got to run
+            self._stop_event.set()
+        await _job_coro(job, self._stop_event)
+
+    def _request_stop(self):
+        self._stop_requested = True
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def stop(self, timeout):
+        """Signal the job to stop and wait up to `timeout` seconds for it to finish."""
+        scheduler_thread.loop.call_soon_threadsafe(self._request_stop)
+        futures.wait([self.future], timeout=timeout)
+
+async def _job_coro(job, stop_event):
+    """
+    Schedule loop for a single job dict.
     job dict: id, name, db, type, interval, time, day, date, status
+    Sleeps until the next run (or until stop_event is set) instead of polling.
     """
-    jid = job["id"]
-    stop_ev = job_threads[jid]["stop"]
-    add_log(f"🕒 Job '{job.get('name') or jid}' started (type={job['type']})")
-    while not stop_ev.is_set():
+    loop = asyncio.get_running_loop()
+    add_log(f"🕒 Job '{job.get('name') or job['id']}' started (type={job['type']})")
+    while not stop_event.is_set():
         try:
-            next_run = _next_run_time_now(job["type"], job.get("interval"), job.get("time"), job.get("day"), job.get("date"))
+            next_run = job_schedules[job["id"]](datetime.now())
             job["next_run"] = next_run.strftime("%Y-%m-%d %H:%M:%S")
+            _touch_jobs(job)
             add_log(f"⏳ Job '{job.get('name')}' next run at {job['next_run']}")
             # wait until next_run or stop
-            while not stop_ev.is_set():
-                now = datetime.now()
-                if now >= next_run:
-                    break
-                sleep_seconds = min(10, (next_run - now).total_seconds())
-                if sleep_seconds > 0:
-                    time.sleep(sleep_seconds)
-            if stop_ev.is_set():
+            try:
+                timeout = max(0, (next_run - datetime.now()).total_seconds())
+                await asyncio.wait_for(stop_event.wait(), timeout=timeout)
                 break
-            # execute
+            except asyncio.TimeoutError:
+                pass
+            # execute (blocking sync work runs off the loop)
             job["status"] = "running"
+            _touch_jobs(job)
             add_log(f"🟢 Job '{job.get('name')}' executing run_once_all (DB: {job.get('db')})")
             try:
-                main_sync.run_once_all(db_name=job.get("db"))
+                await loop.run_in_executor(SYNC_POOL, partial(main_sync.run_once_all, db_name=job.get("db")))
                 add_log(f"✅ Job '{job.get('name')}' run completed.")
             except Exception as ex:
                 add_log(f"⚠ Job '{job.get('name')}' run failed: {ex}")
             job["status"] = "idle"
+            _touch_jobs(job)
             # small pause before next schedule loop
-            time.sleep(1)
+            await asyncio.sleep(1)
         except Exception as e:
             add_log(f"⚠ Job loop '{job.get('name')}' error: {e}")
-            time.sleep(5)
+            await asyncio.sleep(5)
     add_log(f"🛑 Job '{job.get('name')}' stopped.")
 
 # ---------------- JOB MANAGEMENT ENDPOINTS ----------------
@@ -416,8 +696,15 @@ def _job_loop(job):
 @login_required
 def jobs_page():
     """Return job list JSON (front-end uses it)."""
+    etag = f"jobs-{_BOOT_ID}-{_jobs_version}"
+    cached = _not_modified(etag)
+    if cached:
+        return cached
     # Provide a serializable copy
-    return jsonify({"jobs": jobs})
+    with _jobs_lock:
+        snapshot = list(jobs)
+        etag = f"jobs-{_BOOT_ID}-{_jobs_version}"
+    return _with_etag(jsonify({"jobs": snapshot}), etag)
 
 @app.route("/jobs/create", methods=["POST"])
 @login_required
@@ -435,9 +722,11 @@ def create_job():
       - auto_start: true/false
     """
     data = request.get_json() or {}
+    with _jobs_lock:
+        job_count = len(jobs)
     job = {
         "id": str(uuid.uuid4()),
-        "name": data.get("name") or f"Job-{len(jobs)+1}",
+        "name": data.get("name") or f"Job-{job_count+1}",
         "db": data.get("db"),
         "type": data.get("type", "interval"),
         "interval": int(data.get("interval") or 15),
@@ -447,7 +736,14 @@ def create_job():
         "status": "idle",
         "next_run": None
     }
-    jobs.append(job)
+    try:
+        job_schedules[job["id"]] = _compile_schedule(job)
+    except ValueError as e:
+        return jsonify({"error": f"invalid schedule: {e}"}), 400
+    with _jobs_lock:
+        jobs.append(job)
+        jobs_by_id[job["id"]] = job
+    _touch_jobs(job)
     add_log(f"➕ Job created: {job['name']} (id={job['id']})")
     auto_start = data.get("auto_start", False)
     if auto_start:
@@ -463,32 +759,31 @@ def start_job(job_id):
     return jsonify({"status": "started", "job_id": job_id})
 
 def _start_job_internal(job_id):
-    job = next((j for j in jobs if j["id"] == job_id), None)
+    job = jobs_by_id.get(job_id)
     if not job:
         add_log(f"⚠ Start requested but job not found: {job_id}")
         return False
-    if job_id in job_threads and job_threads[job_id]["thread"].is_alive():
+    with _jobs_lock:
+        worker = job_threads.get(job_id)
+        running = worker is not None and not worker.future.done()
+        if not running:
+            job_threads[job_id] = JobWorker(job)
+    if running:
         add_log(f"ℹ️ Job already running: {job['name']}")
         return True
-    stop_ev = threading.Event()
-    t = threading.Thread(target=_job_loop, args=(job,), daemon=True)
-    job_threads[job_id] = {"thread": t, "stop": stop_ev}
-    # pass stop event into job_threads dict so loop can access it via job_threads[job_id]["stop"]
-    job_threads[job_id]["stop"] = stop_ev
-    t.start()
+    job_store.set_active(job_id, True)
     add_log(f"▶ Job started: {job['name']}")
     return True
 
 @app.route("/jobs/<job_id>/stop", methods=["POST"])
 @login_required
 def stop_job(job_id):
-    if job_id not in job_threads:
+    with _jobs_lock:
+        worker = job_threads.pop(job_id, None)
+    if worker is None:
         return jsonify({"error": "job not running"}), 400
-    ev = job_threads[job_id]["stop"]
-    ev.set()
-    thread = job_threads[job_id]["thread"]
-    thread.join(timeout=5)
-    job_threads.pop(job_id, None)
+    worker.stop(timeout=5)
+    job_store.set_active(job_id, False)
     add_log(f"⏹ Job stopped: {job_id}")
     return jsonify({"status": "stopped", "job_id": job_id})
 
@@ -496,12 +791,16 @@ def stop_job(job_id):
 @login_required
 def delete_job(job_id):
     # stop if running
-    if job_id in job_threads:
-        job_threads[job_id]["stop"].set()
-        job_threads[job_id]["thread"].join(timeout=3)
-        job_threads.pop(job_id, None)
-    global jobs
-    jobs = [j for j in jobs if j["id"] != job_id]
+    with _jobs_lock:
+        worker = job_threads.pop(job_id, None)
+    if worker is not None:
+        worker.stop(timeout=3)
+    with _jobs_lock:
+        if jobs_by_id.pop(job_id, None) is not None:
+            jobs[:] = [j for j in jobs if j["id"] != job_id]
+        job_store.delete(job_id)
+        job_schedules.pop(job_id, None)
+    _touch_jobs()
     add_log(f"🗑 Job deleted: {job_id}")
     return jsonify({"status": "deleted", "job_id": job_id})
 
@@ -509,21 +808,62 @@ def delete_job(job_id):
 @login_required
 def update_job(job_id):
     data = request.get_json() or {}
-    job = next((j for j in jobs if j["id"] == job_id), None)
-    if not job:
-        return jsonify({"error": "job not found"}), 404
-    # update fields (simple)
-    job["name"] = data.get("name", job["name"])
-    job["db"] = data.get("db", job.get("db"))
-    job["type"] = data.get("type", job["type"])
-    job["interval"] = int(data.get("interval") or job.get("interval") or 15)
-    job["time"] = data.get("time", job.get("time"))
-    job["day"] = data.get("day", job.get("day"))
-    job["date"] = data.get("date", job.get("date"))
+    # held from lookup to apply, so a concurrent update/delete can't leave the
+    # schedule and the job dict out of step (or revive a deleted job's schedule)
+    with _jobs_lock:
+        job = jobs_by_id.get(job_id)
+        if not job:
+            return jsonify({"error": "job not found"}), 404
+        # update fields (simple); the schedule is re-parsed before anything is applied
+        updated = dict(job)
+        updated["name"] = data.get("name", job["name"])
+        updated["db"] = data.get("db", job.get("db"))
+        updated["type"] = data.get("type", job["type"])
+        updated["interval"] = int(data.get("interval") or job.get("interval") or 15)
+        updated["time"] = data.get("time", job.get("time"))
+        updated["day"] = data.get("day", job.get("day"))
+        updated["date"] = data.get("date", job.get("date"))
+        try:
+            job_schedules[job_id] = _compile_schedule(updated)
+        except ValueError as e:
+            return jsonify({"error": f"invalid schedule: {e}"}), 400
+        job.update(updated)
+    _touch_jobs(job)
     add_log(f"✏️ Job updated: {job['name']} (id={job_id})")
     return jsonify({"job": job})
 
+# ---------------- RESTORE PERSISTED JOBS ----------------
+# Runs at import and restarts every active job in this process's scheduler. Only ONE
+# process may serve the portal (see GUNICORN_CMD): a second worker or instance on the
+# same STATE_DB would run each active job twice, since jobs aren't claimed/leased.
+def _restore_jobs():
+    """Reload saved jobs and restart the ones that were running before shutdown."""
+    for job, active in job_store.load():
+        try:
+            job_schedules[job["id"]] = _compile_schedule(job)
+        except ValueError as e:
+            add_log(f"⚠ Skipping saved job '{job.get('name')}': invalid schedule ({e})")
+            continue
+        job["status"] = "idle"
+        job["next_run"] = None
+        with _jobs_lock:
+            jobs.append(job)
+            jobs_by_id[job["id"]] = job
+        if active:
+            _start_job_internal(job["id"])
+    _touch_jobs()
+
+_restore_jobs()
+
 # ---------------- MAIN ----------------
+# Jobs, logs and the scheduler loop live in this process, so serve with ONE
+# worker and let gthread threads provide the request concurrency. Multiple
+# workers/instances are not supported: each would run every active job.
+GUNICORN_CMD = "gunicorn -k gthread -w 1 --threads 16 --chdir act -b 0.0.0.0:5000 web_app:app"
+
 if __name__ == "__main__":
+    if os.environ.get("FLASK_DEBUG") != "1":
+        raise SystemExit(f"Run via: {GUNICORN_CMD}  (or set FLASK_DEBUG=1 for the dev server)")
     logging.basicConfig(level=logging.INFO)
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # no reloader: it would import the module twice and start a second scheduler
+    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False, threaded=True)
@@ -4,11 +4,13 @@ TallyPrime EDU → Export all masters to CSV (safe XML cleaning)
 """
 
 import requests
-import xml.etree.ElementTree as ET
+from lxml import etree
 import pandas as pd
-import re
+from collections import deque
 
 TALLY_URL = "http://localhost:9000"
+session = requests.Session()
+session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=3))
 
 xml_req = """<ENVELOPE>
  <HEADER>
@@ -26,44 +28,60 @@ xml_req = """<ENVELOPE>
  </BODY>
 </ENVELOPE>"""
 
+MASTER_TAGS = (
+    "COMPANY", "CURRENCY", "GROUP", "LEDGER",
+    "STOCKGROUP", "STOCKCATEGORY", "STOCKITEM",
+    "UNIT", "GODOWN", "COSTCATEGORY", "COSTCENTRE"
+)
+# Invalid XML bytes (anything but tab/LF/CR/printable ASCII), deleted chunk by chunk
+_INVALID = bytes(b for b in range(256) if b not in (0x09, 0x0A, 0x0D) and not 0x20 <= b <= 0x7F)
+RAW_COPY = "raw_tally_response.xml"
+RAW_TAIL_CHUNKS = 16  # last ~1 MiB of raw bytes kept for the error dump
+
 print("🔗 Connecting to Tally at", TALLY_URL)
 try:
-    resp = requests.post(TALLY_URL, data=xml_req.encode(), timeout=15)
+    resp = session.post(TALLY_URL, data=xml_req.encode(), timeout=15, stream=True)
     print("HTTP status:", resp.status_code)
     if resp.status_code != 200:
         raise Exception("Invalid response")
-    xml_data = resp.text
-    print("\n--- First 500 chars of response ---\n", xml_data[:500])
 except Exception as e:
     print("❌ Error connecting:", e)
     exit()
 
-# 🧹 Clean invalid XML characters
-xml_data_clean = re.sub(r"[^\x09\x0A\x0D\x20-\x7F]+", "", xml_data)
-
-# 🧩 Parse cleaned XML safely
+# 🧩 Clean + parse the response as it streams in; finished master elements are
+# collected and cleared so memory stays bounded by one element, not the document
+buckets = {tag: [] for tag in MASTER_TAGS}
+parser = etree.XMLPullParser(events=("end",), tag=MASTER_TAGS)
+# only the most recent raw chunks are kept (in memory), and written out just when parsing fails
+raw_tail = deque(maxlen=RAW_TAIL_CHUNKS)
 try:
-    root = ET.fromstring(xml_data_clean)
+    for i, chunk in enumerate(resp.iter_content(chunk_size=64 * 1024)):
+        raw_tail.append(chunk)
+        if i == 0:
+            print("\n--- First 500 chars of response ---\n", chunk[:500].decode("utf-8", "replace"))
+        parser.feed(chunk.translate(None, _INVALID))
+        for _, elem in parser.read_events():
+            buckets[elem.tag].append((elem.findtext("NAME"), elem.findtext("PARENT")))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    parser.close()
 except Exception as e:
     print("❌ Still failed to parse XML:", e)
-    with open("raw_tally_response.xml", "w", encoding="utf-8") as f:
-        f.write(xml_data)
-    print("⚠️ Saved full XML to raw_tally_response.xml for review.")
+    with open(RAW_COPY, "wb") as raw_copy:
+        raw_copy.writelines(raw_tail)
+    print(f"⚠️ Saved the last {len(raw_tail)} raw chunk(s) before the error to {RAW_COPY} for review.")
     exit()
 
-# 🗂️ Collect all master data
-records = []
-for tag in [
-    "COMPANY", "CURRENCY", "GROUP", "LEDGER",
-    "STOCKGROUP", "STOCKCATEGORY", "STOCKITEM",
-    "UNIT", "GODOWN", "COSTCATEGORY", "COSTCENTRE"
-]:
-    for node in root.findall(f".//{tag}"):
-        name = node.findtext("NAME")
-        parent = node.findtext("PARENT")
-        records.append({"MASTER_TYPE": tag, "NAME": name, "PARENT": parent})
+# 🗂️ Collect all master data (grouped by master type, as before) into columns
+master_types, names, parents = [], [], []
+for tag in MASTER_TAGS:
+    pairs = buckets[tag]
+    master_types.extend([tag] * len(pairs))
+    names.extend(name for name, _ in pairs)
+    parents.extend(parent for _, parent in pairs)
 
-df = pd.DataFrame(records)
+df = pd.DataFrame({"MASTER_TYPE": master_types, "NAME": names, "PARENT": parents}, copy=False)
 if df.empty:
     print("⚠️ No records found — please ensure a company is open in Tally.")
 else:
@@ -8,14 +8,18 @@ TallyPrime → SQL Server Sync
 """
 
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
 import pyodbc
 import pandas as pd
 import re
 import logging
-import hashlib
+from functools import lru_cache
 from apscheduler.schedulers.blocking import BlockingScheduler
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ---------------- CONFIG ----------------
 # TallyPrime server URL and request headers
@@ -27,6 +31,8 @@ SQL_SERVERS_TO_TRY = [r"LOHITH\\SQLEXPRESS", "127.0.0.1,1433"]  # possible SQL s
 ODBC_DRIVER = "{ODBC Driver 17 for SQL Server}"                 # ODBC driver
 DEFAULT_DB = "lohit"                                            # default database name
 UPSERT_BATCH_SIZE = 200                                         # batch size for inserts/updates
+STAGING_CHUNK_SIZE = 10000                                      # rows per executemany into #stg
+FETCH_WORKERS = 8                                               # masters fetched from Tally concurrently
 
 # Logging configuration (both file + console output)
 logging.basicConfig(
@@ -78,6 +84,7 @@ def connect_sql_interactive():
                 f"DRIVER={ODBC_DRIVER};SERVER={server};DATABASE={db_name};Trusted_Connection=yes;",
                 timeout=5
             )
+            conn.execute("SET NOCOUNT ON")  # no per-statement row-count messages
             logging.info(f"Connected to database {db_name} on server {server}")
             return conn
         except Exception as e:
@@ -95,6 +102,7 @@ def connect_sql_default():
                 f"DRIVER={ODBC_DRIVER};SERVER={server};DATABASE={DEFAULT_DB};Trusted_Connection=yes;",
                 timeout=5
             )
+            conn.execute("SET NOCOUNT ON")  # no per-statement row-count messages
             logging.info(f"Connected to default DB {DEFAULT_DB} on server {server}")
             return conn
         except Exception as e:
@@ -102,16 +110,103 @@ def connect_sql_default():
     raise Exception("All SQL Server connection attempts failed.")
 
 # ---------------- HASH UTILS ----------------
-def compute_row_hash(row: pd.Series) -> str:
+def compute_row_hashes(df: pd.DataFrame) -> list:
     """
-    Compute a stable SHA1 hash for a row.
+    Compute a stable 64-bit hash per row, as 8 raw bytes (stored in a BINARY(8) column).
     - Excludes metadata columns (those starting with '_').
+    - Hashed column-wise in C by pandas (fixed key, so stable across runs).
     - Used for change detection to avoid unnecessary updates.
     """
-    content = "|".join(str(v) if v is not None else "" for k, v in row.items() if not k.startswith("_"))
-    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+    data_cols = [c for c in df.columns if not c.startswith("_")]
+    hashes = pd.util.hash_pandas_object(df[data_cols], index=False).to_numpy()
+    return [h.to_bytes(8, "big") for h in hashes.tolist()]
+
+# SQL types for new tables/columns; everything else is bounded text (kept in-row, indexable)
+_TYPE_MAP = {
+    "NAME": "NVARCHAR(255)",
+    "PARENT": "NVARCHAR(255)",
+    "OPENINGBALANCE": "DECIMAL(19,4)",
+    "_HASH": "BINARY(8)",
+    "_SYNCED_AT": "DATETIME2(0)",
+    "_ALTERID": "INT",
+    "_GUID": "NVARCHAR(64)",   # Tally GUIDs are "<company guid>-<hex id>", longer than 36
+    "_MASTERID": "INT",
+}
+DEFAULT_COLUMN_TYPE = "NVARCHAR(4000)"
+_NUMERIC_SQL_TYPES = ("int", "bigint", "decimal", "numeric")
+_INT_LIMITS = {"int": 2 ** 31, "bigint": 2 ** 63}
+# Tally amount text: optional sign, digits, optional Dr/Cr suffix (separators already removed)
+_AMOUNT_RE = re.compile(r"([+-]?)(\d*)(?:\.(\d*))?\s*(Dr|Cr)?", re.IGNORECASE)
+
+def column_type(col: str) -> str:
+    """SQL type for a synced column when creating/adding it."""
+    return _TYPE_MAP.get(col, DEFAULT_COLUMN_TYPE)
+
+def cached_type(sql_type: str) -> str:
+    """Type as kept in _SCHEMA_CACHE: decimal/numeric keep '(precision,scale)', others just the name."""
+    sql_type = sql_type.lower().replace(" ", "")
+    return sql_type if sql_type.startswith(("decimal", "numeric")) else sql_type.split("(")[0]
+
+def numeric_text(value: str, sql_type: str):
+    """
+    Tally number text as a plain literal that SQL Server will accept for `sql_type`, or None.
+    - Drops thousands separators; a Dr suffix makes the amount negative (Tally's sign for debits).
+    - Rejects exponents, inf/nan, fractions for integer columns and values out of the column's range.
+    """
+    m = _AMOUNT_RE.fullmatch(value.replace(",", "").strip())
+    if not m or not (m.group(2) or m.group(3)):
+        return None
+    sign, whole, frac, drcr = m.groups()
+    negative = (sign == "-") != ((drcr or "").lower() == "dr")
+    whole = whole.lstrip("0") or "0"
+    frac = (frac or "").rstrip("0")
+    name, _, params = sql_type.partition("(")
+    if name in _INT_LIMITS:
+        n = -int(whole) if negative else int(whole)
+        if frac or not -_INT_LIMITS[name] <= n < _INT_LIMITS[name]:
+            return None
+        return str(n)
+    precision, scale = (int(p) for p in params.rstrip(")").split(",")) if params else (18, 0)
+    if len(whole) > precision:
+        return None
+    # round to the column's scale the way SQL Server would, then check it still fits
+    with localcontext() as ctx:
+        ctx.prec = 2 * precision + 2
+        amount = Decimal(f"{whole}.{frac or '0'}").quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+    if amount >= 10 ** (precision - scale):
+        return None
+    return str(-amount if negative and amount else amount)
 
 # ---------------- UPSERT ----------------
+# (database, table) -> {column: SQL data type} known to exist, with table + indexes already ensured
+_SCHEMA_CACHE = {}
+
+@lru_cache(maxsize=None)
+def staging_sql(table: str, columns: tuple) -> tuple:
+    """
+    Build the staging statements for a table/column layout once.
+    Returns (create_stg_sql, insert_stg_sql, merge_sql, bulk_load_sql); identical text on every sync.
+    """
+    safe_table = f"[{table}]"
+    cols = [f"[{c}]" for c in columns]
+    col_list = ", ".join(cols)
+    assignments = ", ".join(f"t.{c} = s.{c}" for c in cols if c != "[NAME]")
+    source_cols = ", ".join(f"s.{c}" for c in cols)
+    create_sql = f"SELECT TOP 0 {col_list} INTO #stg FROM {safe_table}"
+    insert_sql = f"INSERT INTO #stg ({col_list}) VALUES ({', '.join(['?'] * len(cols))})"
+    # unchanged rows (same _HASH) are left alone, _SYNCED_AT included
+    merge_sql = f"""
+        MERGE {safe_table} AS t
+        USING #stg AS s
+        ON t.[NAME] = s.[NAME]
+        WHEN MATCHED AND (t.[_HASH] IS NULL OR t.[_HASH] <> s.[_HASH]) THEN UPDATE SET {assignments}
+        WHEN NOT MATCHED THEN INSERT ({col_list})
+        VALUES ({source_cols});
+        """
+    # first load into an empty table: TABLOCK lets SQL Server minimally log the insert
+    bulk_sql = f"INSERT INTO {safe_table} WITH (TABLOCK) ({col_list}) SELECT {col_list} FROM #stg"
+    return create_sql, insert_sql, merge_sql, bulk_sql
+
 def upsert_dataframe(df: pd.DataFrame, table: str, conn):
     """
     UPSERT (insert/update) a pandas DataFrame into SQL Server.
@@ -124,118 +219,202 @@ def upsert_dataframe(df: pd.DataFrame, table: str, conn):
         logging.warning(f"Empty DataFrame for {table}, skipping.")
         return
 
-    # Add hash + metadata columns
-    df["_HASH"] = df.apply(compute_row_hash, axis=1)
-    df["_SYNCED_AT"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    if "_ALTERID" not in df.columns: df["_ALTERID"] = None
-    if "_GUID" not in df.columns: df["_GUID"] = None
-    if "_MASTERID" not in df.columns: df["_MASTERID"] = None
+    # Add metadata columns in one assign (one scalar timestamp for every row);
+    # _HASH is filled in once the values are in their stored form, below
+    synced_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    missing_meta = {c: None for c in ("_ALTERID", "_GUID", "_MASTERID") if c not in df.columns}
+    df = df.assign(_HASH=None, _SYNCED_AT=synced_at, **missing_meta)
 
     cursor = conn.cursor()
     safe_table = f"[{table}]"
 
-    # Create table if it doesn’t exist
-    columns = ", ".join([f"[{col}] NVARCHAR(MAX)" for col in df.columns])
-    cursor.execute(f"IF OBJECT_ID(N'{table}', 'U') IS NULL CREATE TABLE {safe_table} ({columns})")
-    conn.commit()
-
-    # Add missing columns if schema changed
-    cursor.execute(f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?", table)
-    existing_cols = {r[0] for r in cursor.fetchall()}
-    missing_cols = [c for c in df.columns if c not in existing_cols]
-    for col in missing_cols:
-        cursor.execute(f"ALTER TABLE {safe_table} ADD [{col}] NVARCHAR(MAX)")
-        logging.info(f"Altering {table}: added new column [{col}]")
-    conn.commit()
-
-    # Create indexes for performance
-    try:
-        cursor.execute(f"""
-            IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table}_NAME')
-            CREATE UNIQUE INDEX IX_{table}_NAME ON {safe_table} ([NAME]);
-        """)
+    # Schema DDL/probes only run the first time a table is seen, or when new columns appear
+    schema_key = (conn.getinfo(pyodbc.SQL_DATABASE_NAME), table)
+    if not set(df.columns).issubset(_SCHEMA_CACHE.get(schema_key, {})):
+        # Create table if it doesn’t exist
+        columns = ", ".join([f"[{col}] {column_type(col)}" for col in df.columns])
+        cursor.execute(f"IF OBJECT_ID(N'{table}', 'U') IS NULL CREATE TABLE {safe_table} ({columns})")
+        conn.commit()
+
+        # Add missing columns if schema changed
         cursor.execute(f"""
-            IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table}_HASH')
-            CREATE INDEX IX_{table}_HASH ON {safe_table} ([_HASH]);
-        """)
+            SELECT COLUMN_NAME,
+                   CASE WHEN DATA_TYPE IN ('decimal', 'numeric')
+                        THEN CONCAT(DATA_TYPE, '(', NUMERIC_PRECISION, ',', NUMERIC_SCALE, ')')
+                        ELSE DATA_TYPE END
+            FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?
+        """, table)
+        col_types = dict(cursor.fetchall())
+        existing_cols = set(col_types)
+        # _HASH used to be hex text; text can't be ALTERed to binary, so recreate it empty
+        # (NULL hashes make every row re-sync once)
+        if col_types.get("_HASH", "binary") != "binary":
+            cursor.execute(f"""
+                IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table}_HASH')
+                DROP INDEX IX_{table}_HASH ON {safe_table};
+            """)
+            cursor.execute(f"ALTER TABLE {safe_table} DROP COLUMN [_HASH]")
+            existing_cols.discard("_HASH")
+            del col_types["_HASH"]
+            logging.info(f"Altering {table}: converting [_HASH] to BINARY(8)")
+        missing_cols = [c for c in df.columns if c not in existing_cols]
+        for col in missing_cols:
+            cursor.execute(f"ALTER TABLE {safe_table} ADD [{col}] {column_type(col)}")
+            logging.info(f"Altering {table}: added new column [{col}]")
         conn.commit()
-        logging.info(f"Ensured indexes on {table}: [NAME] (unique), [_HASH]")
-    except Exception as e:
-        logging.warning(f"Could not create indexes on {table}: {e}")
-
-    # Upsert rows one by one
-    for _, row in df.iterrows():
-        cursor.execute(f"SELECT _HASH FROM {safe_table} WHERE [NAME] = ?", row["NAME"])
-        existing = cursor.fetchone()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        if not existing:
-            # Insert new row
-            placeholders = ", ".join(["?"] * len(df.columns))
-            cursor.execute(
-                f"INSERT INTO {safe_table} ({', '.join(f'[{c}]' for c in df.columns)}) VALUES ({placeholders})",
-                row.tolist()
-            )
-        else:
-            if existing[0] != row["_HASH"]:
-                # Update row if data changed
-                assignments = ", ".join([f"[{col}] = ?" for col in df.columns if col != "_SYNCED_AT"])
-                cursor.execute(
-                    f"UPDATE {safe_table} SET {assignments}, [_SYNCED_AT] = ? WHERE [NAME] = ?",
-                    [row[c] for c in df.columns if c != "_SYNCED_AT"] + [now, row["NAME"]]
-                )
-            else:
-                logging.debug(f"Skipped unchanged row: {row['NAME']}")
 
-    conn.commit()
+        # Create indexes for performance
+        try:
+            cursor.execute(f"""
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table}_NAME')
+                CREATE UNIQUE INDEX IX_{table}_NAME ON {safe_table} ([NAME]);
+            """)
+            cursor.execute(f"""
+                IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_{table}_HASH')
+                CREATE INDEX IX_{table}_HASH ON {safe_table} ([_HASH]);
+            """)
+            conn.commit()
+            logging.info(f"Ensured indexes on {table}: [NAME] (unique), [_HASH]")
+        except Exception as e:
+            logging.warning(f"Could not create indexes on {table}: {e}")
+        col_types.update({c: cached_type(column_type(c)) for c in missing_cols})
+        _SCHEMA_CACHE[schema_key] = col_types
+
+    df = df.drop_duplicates(subset="NAME", keep="last")  # MERGE may touch each target row once
+
+    # numeric target columns: send a plain literal that fits the column, else NULL
+    # (one bad value would otherwise make SQL Server reject the whole MERGE)
+    coerced = {}
+    col_types = _SCHEMA_CACHE[schema_key]
+    for col in [c for c in df.columns if col_types.get(c, "").split("(")[0] in _NUMERIC_SQL_TYPES]:
+        text = df[col].astype(str).astype(object).where(df[col].notna(), None)
+        values = text.map(lambda v: numeric_text(v, col_types[col]), na_action="ignore")
+        bad = text.notna() & values.isna()
+        if bad.any():
+            sample = dict(zip(df.loc[bad, "NAME"].head(5), text[bad].head(5)))
+            logging.warning(f"{table}.[{col}]: {int(bad.sum())} value(s) not valid for {col_types[col]} "
+                            f"stored as NULL, e.g. {sample}")
+        coerced[col] = values
+    df = df.assign(**coerced)
+    # hash what is actually stored, so a row whose value was nulled re-syncs once it's fixed
+    df = df.assign(_HASH=compute_row_hashes(df))
+
+    # Bulk-load the rows into a staging table, then apply them with one MERGE;
+    # unchanged rows are filtered server-side by the MERGE's _HASH comparison
+    create_sql, insert_sql, merge_sql, bulk_sql = staging_sql(table, tuple(df.columns))
+    cursor.fast_executemany = True
+    try:
+        cursor.execute("IF OBJECT_ID('tempdb..#stg') IS NOT NULL DROP TABLE #stg")
+        cursor.execute(create_sql)
+        # fast_executemany binds a whole batch with one type per column: send str or None only
+        # (plus the bytes _HASH column, kept out of astype(str), which would try to decode it)
+        text = df.drop(columns="_HASH")
+        params = text.astype(str).astype(object).where(text.notna(), None)  # object: None stays None
+        params = params.assign(_HASH=df["_HASH"])[list(df.columns)]  # bytes, bound as binary
+        rows = list(params.itertuples(index=False, name=None))
+        for start in range(0, len(rows), STAGING_CHUNK_SIZE):
+            cursor.executemany(insert_sql, rows[start:start + STAGING_CHUNK_SIZE])
+        target_empty = cursor.execute(f"SELECT TOP 1 1 FROM {safe_table}").fetchone() is None
+        cursor.execute(bulk_sql if target_empty else merge_sql)
+        cursor.execute("DROP TABLE #stg")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        _SCHEMA_CACHE.pop(schema_key, None)  # the table itself may be what changed; re-probe next time
+        raise
     logging.info(f"Synced {len(df)} rows into {table}")
 
 # ---------------- TALLY UTILS ----------------
-def send_request(xml: str) -> str:
+# One keep-alive session for every Tally call instead of a new socket per master
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                     max_retries=Retry(total=3, backoff_factor=0.2)))
+
+# XML cleanup tables/patterns, built once (applied to raw response bytes)
+_CTRL_BYTES = bytes(list(range(0, 9)) + [11, 12] + list(range(14, 32)))  # deleted via bytes.translate
+_AMP_RE = re.compile(rb"&(?!(amp;|lt;|gt;|apos;|quot;))")
+_AMP_LOOKAHEAD = 5  # bytes _AMP_RE needs after '&' to decide ("quot;")
+
+class CleanXmlStream:
+    """
+    Read-only file-like wrapper that cleans a raw XML byte stream on the fly.
+    - Removes control chars and escapes bare ampersands, chunk by chunk.
+    - Holds back an '&' near the end of a chunk until its entity can be seen whole.
     """
-    Send XML request to Tally server and return raw response text.
+    def __init__(self, raw, chunk_size=64 * 1024):
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._carry = b""
+
+    def _clean(self, data: bytes) -> bytes:
+        return _AMP_RE.sub(b"&amp;", data.translate(None, _CTRL_BYTES))
+
+    def read(self, size=-1) -> bytes:
+        while True:
+            chunk = self._raw.read(size if size and size > 0 else self._chunk_size)
+            data = self._carry + chunk
+            if not chunk:  # EOF: whatever is left can be decided now
+                self._carry = b""
+                return self._clean(data)
+            hold = data.find(b"&", max(0, len(data) - _AMP_LOOKAHEAD))
+            if hold == -1:
+                hold = len(data)
+            self._carry = data[hold:]
+            out = self._clean(data[:hold])
+            if out:  # b"" would signal EOF, so keep reading past chunks that cleaned to nothing
+                return out
+
+def send_request(body: bytes):
+    """
+    Send an (already encoded) XML request to Tally server.
+    - Returns the streaming response (body not yet read), or None on failure.
+    - 3 s to connect, 60 s between received bytes.
     """
     try:
-        resp = requests.post(TALLY_URL, data=xml.encode("utf-8"), headers=HEADERS)
-        return resp.text
+        resp = SESSION.post(TALLY_URL, data=body, timeout=(3, 60), stream=True)
+        resp.raw.decode_content = True  # let urllib3 undo any gzip transfer encoding
+        return resp
     except Exception as e:
         logging.error(f"Tally request failed: {e}")
-        return ""
+        return None
 
-def parse_xml_to_df(xml: str, tags: list) -> pd.DataFrame:
+def parse_xml_to_df(resp, tags: list) -> pd.DataFrame:
     """
-    Parse Tally XML response into a pandas DataFrame.
+    Parse a streaming Tally XML response into a pandas DataFrame.
     - Extracts only requested tags.
-    - Cleans illegal characters.
+    - Cleans illegal characters as bytes arrive.
+    - Streams COLLECTION elements with lxml, freeing each once read.
     """
+    if resp is None:
+        return pd.DataFrame(columns=tags)
     try:
-        xml = re.sub(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]", "", xml)  # remove control chars
-        xml = re.sub(r"&(?!(amp;|lt;|gt;|apos;|quot;))", "&amp;", xml)  # fix bad ampersands
-        root = ET.fromstring(xml)
+        tag_pos = {tag: i for i, tag in enumerate(tags)}
         rows = []
-        for obj in root.iter("COLLECTION"):
-            for child in obj:
-                row = {}
-                for tag in tags:
-                    el = child.find(tag)
-                    row[tag] = el.text if el is not None else None
-                rows.append(row)
-        return pd.DataFrame(rows)
+        with resp:
+            # still cleaned first: libxml2's recovery would drop bare '&' (and the text after it)
+            for _, coll in etree.iterparse(CleanXmlStream(resp.raw), events=("end",), tag="COLLECTION",
+                                           recover=True, huge_tree=False):
+                for child in coll:
+                    # one walk over the child's elements; first occurrence of each tag wins
+                    row = [None] * len(tags)
+                    for el in child:
+                        i = tag_pos.get(el.tag)
+                        if i is not None and row[i] is None:
+                            row[i] = el.text
+                    rows.append(row)
+                coll.clear()
+                while coll.getprevious() is not None:
+                    del coll.getparent()[0]
+        return pd.DataFrame(rows, columns=tags)
     except Exception as e:
         logging.error(f"Parse error: {e}")
         return pd.DataFrame(columns=tags)
 
-def fetch_master(master: str, full_fields: list):
-    """
-    Fetch a master from Tally.
-    - First tries Licensed mode (full fields).
-    - Falls back to Edu mode (NAME + IDs only).
-    Returns a DataFrame.
-    """
-    tally_fields = full_fields + ["_ALTERID", "_GUID", "_MASTERID"]
-
-    # Licensed/full mode request
-    xml_full = f"""
+@lru_cache(maxsize=64)
+def build_full_request(master: str, tally_fields: tuple) -> bytes:
+    """Licensed/full mode request body for a master, encoded once per (master, fields)."""
+    xml = f"""
     <ENVELOPE>
       <HEADER>
         <VERSION>1</VERSION>
@@ -259,14 +438,12 @@ def fetch_master(master: str, full_fields: list):
       </BODY>
     </ENVELOPE>
     """
-    resp = send_request(xml_full)
-    df = parse_xml_to_df(resp, tally_fields)
-    if not df.empty:
-        logging.info(f"{master}: Licensed mode (full fields)")
-        return df
+    return xml.encode("utf-8")
 
-    # Edu fallback request
-    xml_edu = f"""
+@lru_cache(maxsize=64)
+def build_edu_request(master: str) -> bytes:
+    """Edu fallback request body for a master (NAME + IDs), encoded once per master."""
+    xml = f"""
     <ENVELOPE>
       <HEADER>
         <VERSION>1</VERSION>
@@ -290,7 +467,26 @@ def fetch_master(master: str, full_fields: list):
       </BODY>
     </ENVELOPE>
     """
-    resp = send_request(xml_edu)
+    return xml.encode("utf-8")
+
+def fetch_master(master: str, full_fields: list):
+    """
+    Fetch a master from Tally.
+    - First tries Licensed mode (full fields).
+    - Falls back to Edu mode (NAME + IDs only).
+    Returns a DataFrame.
+    """
+    tally_fields = full_fields + ["_ALTERID", "_GUID", "_MASTERID"]
+
+    # Licensed/full mode request
+    resp = send_request(build_full_request(master, tuple(tally_fields)))
+    df = parse_xml_to_df(resp, tally_fields)
+    if not df.empty:
+        logging.info(f"{master}: Licensed mode (full fields)")
+        return df
+
+    # Edu fallback request
+    resp = send_request(build_edu_request(master))
     df = parse_xml_to_df(resp, ["NAME", "_ALTERID", "_GUID", "_MASTERID"])
     logging.info(f"{master}: Edu mode (NAME + IDs)")
     return df
@@ -325,6 +521,22 @@ MASTERS = {
 }
 
 # ---------------- RUN MODES ----------------
+def sync_masters(selected: list, conn):
+    """
+    Fetch the selected masters from Tally concurrently and upsert each one
+    as soon as it arrives. SQL stays on the caller's single connection.
+    """
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        pending = {}
+        for master in selected:
+            logging.info(f"Fetching {master}...")
+            pending[pool.submit(fetch_master, master, MASTERS[master])] = master
+        for fut in as_completed(pending):
+            master = pending[fut]
+            df = fut.result()
+            logging.info(f"{master}: Parsed {len(df)} rows")
+            upsert_dataframe(df, master, conn)
+
 def run_interactive():
     """
     Interactive mode:
@@ -341,33 +553,68 @@ def run_interactive():
         selected = list(MASTERS.keys())
     else:
         nums = [int(x) for x in choice.split(",") if x.strip().isdigit()]
-        selected = [list(MASTERS.keys())[i - 1] for i in nums if 1 <= i <= len(MASTERS)]
+        master_keys = list(MASTERS)  # dicts keep insertion order, matching the numbered menu
+        selected = [master_keys[i - 1] for i in nums if 1 <= i <= len(master_keys)]
 
-    for master in selected:
-        fields = MASTERS[master]
-        logging.info(f"Fetching {master}...")
-        df = fetch_master(master, fields)
-        logging.info(f"{master}: Parsed {len(df)} rows")
-        upsert_dataframe(df, master, conn)
+    sync_masters(selected, conn)
 
     conn.close()
     logging.info("Interactive sync complete.")
 
-def run_once_all():
+def run_once_all(conn=None):
     """
     One-time mode:
-    - Connects to default DB.
+    - Connects to default DB (unless an open connection is passed in; that one is left open).
     - Fetches all masters and syncs them.
     """
-    conn = connect_sql_default()
-    for master, fields in MASTERS.items():
-        logging.info(f"Fetching {master}...")
-        df = fetch_master(master, fields)
-        logging.info(f"{master}: Parsed {len(df)} rows")
-        upsert_dataframe(df, master, conn)
-    conn.close()
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_sql_default()
+    try:
+        sync_masters(list(MASTERS), conn)
+    finally:
+        if own_conn:
+            conn.close()
     logging.info("One-time sync (all masters) complete.")
 
+# Connection kept open across scheduler ticks (APScheduler never overlaps one job's runs)
+_scheduler_conn = None
+
+def _connection_lost(conn, err):
+    """True if `err` came from a broken link rather than from the SQL itself."""
+    if err.args and str(err.args[0]).startswith("08"):  # SQLSTATE class 08: connection exception
+        return True
+    try:
+        conn.cursor().execute("SELECT 1").fetchone()
+        return False
+    except pyodbc.Error:
+        return True
+
+def run_scheduled_sync():
+    """
+    Scheduler tick: sync all masters over the long-lived connection.
+    - Reconnects and retries once if the connection turns out to be broken.
+    - Other SQL errors (bad data, permissions, ...) are raised without a retry.
+    """
+    global _scheduler_conn
+    for attempt in (1, 2):
+        try:
+            if _scheduler_conn is None:
+                _scheduler_conn = connect_sql_default()
+            run_once_all(_scheduler_conn)
+            return
+        except pyodbc.Error as e:
+            if _scheduler_conn is None or not _connection_lost(_scheduler_conn, e):
+                raise
+            logging.warning(f"Scheduled sync failed on SQL connection (attempt {attempt}): {e}")
+            try:
+                _scheduler_conn.close()
+            except Exception:
+                pass
+            _scheduler_conn = None
+            if attempt == 2:
+                raise
+
 def run_scheduler():
     """
     Scheduler mode:
@@ -386,12 +633,12 @@ def run_scheduler():
         run_once_all()
     elif choice == "2":
         secs = int(input("Interval seconds [60]: ") or "60")
-        scheduler.add_job(run_once_all, "interval", seconds=secs)
+        scheduler.add_job(run_scheduled_sync, "interval", seconds=secs)
         scheduler.start()
     elif choice == "3":
         t = input("Enter time HH:MM [02:00]: ").strip() or "02:00"
         hh, mm = map(int, t.split(":"))
-        scheduler.add_job(run_once_all, "cron", hour=hh, minute=mm)
+        scheduler.add_job(run_scheduled_sync, "cron", hour=hh, minute=mm)
         scheduler.start()
 
 # ---------------- MAIN ----------------
@@ -103,7 +103,8 @@ def upsert_dataframe(df: pd.DataFrame, table: str, conn):
     # --- END NEW ---
 
     # Upsert rows
-    for _, row in df.iterrows():
+    name_idx = df.columns.get_loc("NAME")
+    for row in df.itertuples(index=False, name=None):
         assignments = ", ".join([f"[{col}] = ?" for col in df.columns])
         placeholders = ", ".join(["?"] * len(df.columns))
         sql = f"""
@@ -114,8 +115,7 @@ def upsert_dataframe(df: pd.DataFrame, table: str, conn):
         WHEN NOT MATCHED THEN INSERT ({", ".join(f"[{c}]" for c in df.columns)})
         VALUES ({placeholders});
         """
-        values = [row["NAME"]] + row.tolist() + row.tolist()
-        cursor.execute(sql, values)
+        cursor.execute(sql, (row[name_idx], *row, *row))
     conn.commit()
     logging.info(f"Upserted {len(df)} rows into {table}")
 
@@ -0,0 +1,120 @@
+"""
+upsert_dataframe against a recording fake connection (no SQL Server needed).
+Run with: python -m pytest temp/test_samp_upsert.py
+"""
+
+import re
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyodbc")
+samp = pytest.importorskip("samp")
+
+# INFORMATION_SCHEMA answer for an existing Ledger table
+LEDGER_TYPES = [
+    ("NAME", "nvarchar"), ("PARENT", "nvarchar"), ("OPENINGBALANCE", "decimal(19,4)"),
+    ("_HASH", "binary"), ("_SYNCED_AT", "datetime2"),
+    ("_ALTERID", "int"), ("_GUID", "nvarchar"), ("_MASTERID", "int"),
+]
+
+
+class FakeCursor:
+    fast_executemany = False
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *params):
+        self.conn.sql.append(sql)
+        return self
+
+    def fetchall(self):
+        return list(LEDGER_TYPES)
+
+    def fetchone(self):
+        return None  # target table empty
+
+    def executemany(self, sql, rows):
+        self.conn.staged_columns = re.findall(r"\[(\w+)\]", sql.split("VALUES")[0])
+        self.conn.staged.extend(rows)
+
+
+class FakeConn:
+    def __init__(self):
+        self.sql, self.staged, self.staged_columns, self.commits = [], [], [], 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def getinfo(self, key):
+        return "testdb"
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def _fresh_schema_cache():
+    samp._SCHEMA_CACHE.clear()
+    yield
+    samp._SCHEMA_CACHE.clear()
+
+
+def _ledgers():
+    return pd.DataFrame({
+        "NAME": ["Cash", "Bank", "Sales"],
+        "PARENT": ["Cash-in-Hand", "Bank Accounts", "Sales Accounts"],
+        "OPENINGBALANCE": ["1500.00", "-2500", None],
+    })
+
+
+def test_staged_rows_carry_binary_hashes():
+    conn = FakeConn()
+    samp.upsert_dataframe(_ledgers(), "Ledger", conn)
+    hash_idx = conn.staged_columns.index("_HASH")
+
+    assert len(conn.staged) == 3
+    # hashed as stored: OPENINGBALANCE normalised to the column's scale
+    expected = samp.compute_row_hashes(_ledgers().assign(OPENINGBALANCE=["1500.0000", "-2500.0000", None]))
+    assert [row[hash_idx] for row in conn.staged] == expected
+    for row in conn.staged:
+        assert isinstance(row[hash_idx], bytes) and len(row[hash_idx]) == 8
+        # every other value is bound as text or NULL
+        assert all(v is None or isinstance(v, str) for i, v in enumerate(row) if i != hash_idx)
+
+
+def test_missing_values_are_bound_as_null():
+    conn = FakeConn()
+    samp.upsert_dataframe(_ledgers(), "Ledger", conn)
+    balance_idx = conn.staged_columns.index("OPENINGBALANCE")
+    sales = next(row for row in conn.staged if row[0] == "Sales")
+    assert sales[balance_idx] is None
+
+
+def test_tally_amounts_are_normalised_and_out_of_range_values_nulled():
+    df = pd.DataFrame({
+        "NAME": ["Cash", "Bank", "Sales", "Capital"],
+        "PARENT": ["Cash-in-Hand", "Bank Accounts", "Sales Accounts", "Capital Account"],
+        "OPENINGBALANCE": ["1,000.00 Dr", "2,500.50 Cr", "1e400", "12345678901234567"],
+    })
+    conn = FakeConn()
+    samp.upsert_dataframe(df, "Ledger", conn)
+    balance_idx = conn.staged_columns.index("OPENINGBALANCE")
+    staged = {row[0]: row[balance_idx] for row in conn.staged}
+    assert staged == {"Cash": "-1000.0000", "Bank": "2500.5000", "Sales": None, "Capital": None}
+
+
+@pytest.mark.parametrize("value, sql_type, expected", [
+    ("7.00", "int", "7"),
+    ("1.5", "int", None),
+    ("2147483648", "int", None),
+    ("inf", "decimal(19,4)", None),
+    ("nan", "bigint", None),
+    ("999999999999999.99999", "decimal(19,4)", None),  # rounds past the precision
+])
+def test_numeric_text(value, sql_type, expected):
+    assert samp.numeric_text(value, sql_type) == expected